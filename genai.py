@@ -1,92 +1,407 @@
+import os
 import re
+import mmap
+import asyncio
+import time
+import random
+import sqlite3
+import pickle
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import faiss
 import numpy as np
 import nltk
-from nltk.tokenize import sent_tokenize
+from nltk.tokenize.punkt import PunktSentenceTokenizer
 from google import genai
 from google.genai import types
+from google.genai import errors
+
+EMBED_MODEL = "gemini-embedding-001"
+EMBED_DIM = 1536
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+GPU_MAX_K = 1024
+INDEX_BACKENDS = ("cagra", "hnsw", "flat")
+DEFAULT_CACHE_PATH = os.path.join("Responses", "embedding_cache.sqlite")
+
+# Questions behind the UI's quick-question buttons; embedded at ingest time
+CANNED_QUESTIONS = (
+    "What are the different BHK configurations available?",
+    "List all the amenities available in this project.",
+    "Where is this project located? What are nearby landmarks?",
+    "Who is the builder and what are the project details?",
+)
+
+faiss.omp_set_num_threads(os.cpu_count() or 1)
+
+QVEC_CACHE_SIZE = 512
+ANSWER_CACHE_SIZE = 512
+
+# Built databases keyed by _db_cache_key(), oldest evicted first
+DB_CACHE_SIZE = 8
+_DB_CACHE: dict[str, "MarkdownVectorDB"] = {}
+
+_PARA_RE = re.compile(r"\n\s*\n")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _load_punkt():
+    """Load the pretrained English Punkt model once per process."""
+    try:
+        try:
+            from nltk.tokenize import PunktTokenizer  # nltk >= 3.9 (punkt_tab)
+            return PunktTokenizer("english")
+        except ImportError:
+            return nltk.data.load("tokenizers/punkt/english.pickle")
+    except LookupError:
+        print("[WARNING] NLTK punkt data not found, using an untrained sentence tokenizer")
+        return PunktSentenceTokenizer()
+
+
+_PUNKT = _load_punkt()
+
+
+class EmbeddingCache:
+    """Content-addressed sqlite store of float32 embedding vectors."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_key: str, text: str) -> str:
+        return hashlib.blake2b(f"{model_key}|{text}".encode("utf-8"), digest_size=32).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update({k: np.frombuffer(v, dtype=np.float32) for k, v in rows})
+        return found
+
+    def put_many(self, items: dict) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()]
+            )
+            self._conn.commit()
+
+    def get_or_compute_many(self, texts: list, model_key: str, compute) -> list:
+        """Return vectors for texts, calling compute(missing_texts) only for cache misses."""
+        keys = [self.make_key(model_key, t) for t in texts]
+        found = self.get_many(list(set(keys)))
+
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in found:
+                missing.setdefault(k, t)
+        if missing:
+            vectors = compute(list(missing.values()))
+            computed = {k: np.asarray(v, dtype=np.float32) for k, v in zip(missing.keys(), vectors)}
+            self.put_many(computed)
+            found.update(computed)
+
+        return [found[k] for k in keys]
+
 
 class MarkdownVectorDB:
-    def __init__(self, api_key: str, markdown_path: str, chunk_size: int = 800, overlap: int = 100):
+    def __init__(self, api_key: str, markdown_path: str, chunk_size: int = 800, overlap: int = 100,
+                 embed_batch_size: int = 100, embed_workers: int = 5, max_retries: int = 5,
+                 cache_path: str = DEFAULT_CACHE_PATH, use_gpu: bool = True, backend: str = "hnsw",
+                 quantize: bool = True, answer_ttl: float = 3600.0):
+        if backend not in INDEX_BACKENDS:
+            raise ValueError(f"Unknown index backend '{backend}', expected one of {INDEX_BACKENDS}")
         self.client = genai.Client(api_key=api_key)
         self.markdown_path = markdown_path
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.max_retries = max_retries
+        self.backend = backend
+        self.quantize = quantize
+        self.use_gpu = use_gpu and hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
         self.chunks = []
         self.index = None
 
-        # Load and process markdown
+        # Per-instance memoisation of query vectors and generated answers
+        self._qvec_cache: dict[str, np.ndarray] = {}
+        self.answer_ttl = answer_ttl
+        self._answer_cache: dict[str, tuple[float, str]] = {}
+        self._canned_qvecs: dict[str, np.ndarray] = {}
+
+        # Load and process markdown, reusing the index of an identical earlier load
+        # in this process, or the sidecar files written next to the markdown
         self._load_markdown()
-        self._create_index()
+        cache_key = self._db_cache_key()
+        cached = _DB_CACHE.get(cache_key)
+        if cached is not None:
+            self.chunks = cached.chunks
+            self.index = cached.index
+            self._canned_qvecs = cached._canned_qvecs
+            self._answer_cache = cached._answer_cache
+        else:
+            if not self._load_persisted_index(cache_key):
+                self._create_index()
+                self._persist_index(cache_key)
+            _DB_CACHE[cache_key] = self
+            while len(_DB_CACHE) > DB_CACHE_SIZE:
+                # Concurrent uploads may race to evict the same oldest entry
+                _DB_CACHE.pop(next(iter(_DB_CACHE)), None)
 
     def _load_markdown(self):
         """Load markdown file and split into chunks."""
-        with open(self.markdown_path, "r", encoding="utf-8") as f:
-            contents = f.read()
+        with open(self.markdown_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                contents = ""
+                self.content_hash = hashlib.blake2b(b"", digest_size=16).hexdigest()
+            else:
+                # Decode straight from the page-cache mapping, skipping the bytes copy
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    contents = str(buf, "utf-8")
+                    self.content_hash = hashlib.blake2b(buf, digest_size=16).hexdigest()
         self.chunks = self._chunk_text(contents)
 
+    def _db_cache_key(self) -> str:
+        """Key identifying an index built from this markdown with these settings."""
+        return "|".join(str(part) for part in (
+            self.content_hash, EMBED_MODEL, EMBED_DIM, self.chunk_size, self.overlap,
+            self.backend, self.quantize, self.use_gpu,
+        ))
+
+    def _sidecar_path(self) -> str:
+        return self.markdown_path + ".index.pkl"
+
+    def _load_persisted_index(self, cache_key: str) -> bool:
+        """Restore index and chunks from the sidecar file if it matches cache_key."""
+        if self.use_gpu:
+            return False
+        path = self._sidecar_path()
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                saved = pickle.load(f)
+            if saved.get("key") != cache_key:
+                return False
+            self.index = faiss.deserialize_index(saved["index"])
+            self.chunks = saved["chunks"]
+        except Exception as e:
+            print(f"[WARNING] Ignoring unreadable index sidecar for {self.markdown_path}: {e}")
+            return False
+        self._preload_canned_questions()
+        return True
+
+    def _persist_index(self, cache_key: str) -> None:
+        """Write the CPU index and its chunks next to the markdown for reuse after restart."""
+        if self.use_gpu:
+            return
+        path = self._sidecar_path()
+        try:
+            # Index, chunks and key live in one file, replaced atomically, so they always match
+            saved = {"key": cache_key, "chunks": self.chunks, "index": faiss.serialize_index(self.index)}
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"[WARNING] Could not persist index for {self.markdown_path}: {e}")
+
     def _chunk_text(self, text: str):
-        """Split text into overlapping chunks."""
-        paragraphs = re.split(r"\n\s*\n", text.strip())
-        chunks, current_chunk = [], []
-        current_length = 0
-
-        for para in paragraphs:
-            sentences = sent_tokenize(para)
-            for sent in sentences:
-                words = sent.split()
-                sent_len = len(words)
-
-                if current_length + sent_len > self.chunk_size:
-                    chunks.append(" ".join(current_chunk))
-                    overlap_words = current_chunk[-self.overlap:] if self.overlap > 0 else []
-                    current_chunk = overlap_words + words
-                    current_length = len(current_chunk)
-                else:
-                    current_chunk.extend(words)
-                    current_length += sent_len
+        """Split text into overlapping chunks of whole sentences."""
+        # Whitespace-normalised sentences, so word count is spaces + 1
+        sents = []
+        for para in _PARA_RE.split(text.strip()):
+            sents.extend(" ".join(s.split()) for s in _PUNKT.tokenize(para))
+        sents = [s for s in sents if s]
+        if not sents:
+            return []
+
+        # cum[j] - cum[i] is the word count of sents[i:j]
+        word_counts = np.fromiter((s.count(" ") + 1 for s in sents), dtype=np.int64, count=len(sents))
+        cum = np.concatenate(([0], np.cumsum(word_counts)))
 
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+        chunks = []
+        start, n = 0, len(sents)
+        while start < n:
+            # Widest window that fits chunk_size, always taking at least one sentence
+            end = int(np.searchsorted(cum, cum[start] + self.chunk_size, side="right")) - 1
+            end = max(end, start + 1)
+            chunks.append(" ".join(sents[start:end]))
+            if end >= n:
+                break
+            # Carry over trailing sentences totalling at most `overlap` words,
+            # but only as many as still leave room for the next unseen sentence
+            next_start = int(np.searchsorted(cum, cum[end] - self.overlap, side="left"))
+            fit_start = int(np.searchsorted(cum, cum[end + 1] - self.chunk_size, side="left"))
+            start = min(max(next_start, fit_start, start + 1), end)
 
         return chunks
 
+    def _embed_batch(self, slice_idx: int, texts: list, task_type: str = "RETRIEVAL_DOCUMENT"):
+        """Embed one batch of texts, backing off with jitter on rate limits."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = self.client.models.embed_content(
+                    model=EMBED_MODEL,
+                    contents=texts,
+                    config=types.EmbedContentConfig(
+                        output_dimensionality=EMBED_DIM,
+                        task_type=task_type
+                    )
+                )
+                vectors = [e.values for e in res.embeddings]
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"Embedding API returned {len(vectors)} vectors for {len(texts)} inputs")
+                return slice_idx, vectors
+            except errors.APIError as e:
+                if e.code != 429 or attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+    def _embed_texts(self, texts: list, task_type: str) -> np.ndarray:
+        """Embed texts in concurrent batches into an (n, dim) float32 array, preserving input order."""
+        batch_size = self.embed_batch_size
+        batches = [(i, texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+
+        # Results are written back by offset so input order is preserved
+        embeddings = np.empty((len(texts), EMBED_DIM), dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=self.embed_workers) as executor:
+            for slice_idx, vectors in executor.map(lambda b: self._embed_batch(b[0], b[1], task_type), batches):
+                embeddings[slice_idx:slice_idx + len(vectors)] = vectors
+        return embeddings
+
+    def _embed(self, texts: list, task_type: str) -> np.ndarray:
+        """Embed texts into an (n, dim) float32 array, serving repeats from the on-disk cache when enabled."""
+        # Embed each distinct text once (brochures repeat headers and disclaimers)
+        unique = {}
+        for t in texts:
+            unique.setdefault(t, len(unique))
+        unique_texts = list(unique)
+
+        compute = lambda missing: self._embed_texts(missing, task_type)
+        if self.cache is None:
+            unique_vecs = compute(unique_texts)
+        else:
+            model_key = f"{EMBED_MODEL}|{EMBED_DIM}|{task_type}"
+            unique_vecs = np.empty((len(unique_texts), EMBED_DIM), dtype=np.float32)
+            for i, vec in enumerate(self.cache.get_or_compute_many(unique_texts, model_key, compute)):
+                unique_vecs[i] = vec
+        # Fancy indexing returns a fresh array, so callers may normalise it in place
+        return unique_vecs[[unique[t] for t in texts]]
+
     def _create_index(self):
         """Embed chunks and build FAISS index."""
-        embeddings = []
-        for ch in self.chunks:
-            res = self.client.models.embed_content(
-                model="gemini-embedding-001",
-                contents=[ch],
-                config=types.EmbedContentConfig(
-                    output_dimensionality=1536,
-                    task_type="RETRIEVAL_DOCUMENT"
-                )
-            )
-            embeddings.append(res.embeddings[0].values)
+        embeddings = self._embed(self.chunks, "RETRIEVAL_DOCUMENT")
+
+        # Unit-normalise so inner product equals cosine similarity
+        faiss.normalize_L2(embeddings)
 
-        embeddings = np.array(embeddings).astype("float32")
+        self.index = self._build_index(embeddings)
+        self._preload_canned_questions()
 
+    def _preload_canned_questions(self):
+        """Embed the quick-question prompts in one batch so their first query skips the API."""
+        try:
+            qvecs = self._embed(list(CANNED_QUESTIONS), "RETRIEVAL_QUERY")
+        except Exception as e:
+            print(f"[WARNING] Could not preload quick-question embeddings: {e}")
+            return
+        faiss.normalize_L2(qvecs)
+        self._canned_qvecs = {self._normalize_question(q): qvecs[i:i + 1] for i, q in enumerate(CANNED_QUESTIONS)}
+
+    def _build_index(self, embeddings: np.ndarray):
+        """Build the configured FAISS index, falling back CAGRA -> HNSW -> FlatIP."""
         dim = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(embeddings)
+        backend = self.backend
 
-    def query(self, question: str, top_k: int = 3) -> str:
-        """Query the vectordb and return Gemini’s response."""
-        qres = self.client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=[question],
-            config=types.EmbedContentConfig(
-                output_dimensionality=1536,
-                task_type="RETRIEVAL_QUERY"
-            )
-        )
-        qvec = np.array([qres.embeddings[0].values]).astype("float32")
+        if backend == "cagra":
+            try:
+                if not self.use_gpu or not hasattr(faiss, "GpuIndexCagra"):
+                    raise RuntimeError("faiss was built without GPU/cuVS support")
+                self._gpu_res = faiss.StandardGpuResources()
+                index = faiss.GpuIndexCagra(self._gpu_res, dim, faiss.METRIC_INNER_PRODUCT)
+                # CAGRA builds its graph in train(); it does not support incremental add()
+                index.train(embeddings)
+                return index
+            except Exception as e:
+                print(f"[WARNING] CAGRA index unavailable, falling back to HNSW: {e}")
+                backend = "hnsw"
+
+        # GPU FAISS has no HNSW; a brute-force IP scan on the GPU is faster anyway
+        if backend == "hnsw" and not self.use_gpu:
+            try:
+                if self.quantize:
+                    index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+                    index.train(embeddings)
+                else:
+                    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+                index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+                index.add(embeddings)
+                return index
+            except Exception as e:
+                print(f"[WARNING] HNSW index failed, falling back to flat search: {e}")
+
+        if self.quantize and not self.use_gpu:
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        else:
+            index = faiss.IndexFlatIP(dim)
+        index.add(embeddings)
+        if self.use_gpu:
+            self._gpu_res = faiss.StandardGpuResources()
+            index = faiss.index_cpu_to_gpu(self._gpu_res, 0, index)
+        return index
 
-        D, I = self.index.search(qvec, k=top_k)
-        context = "\n".join([self.chunks[idx] for idx in I[0]])
+    def _embed_query(self, question: str) -> np.ndarray:
+        """Embed a question as a unit-normalised (1, dim) float32 row.
+
+        Vectors are memoised under the normalised question, but a miss embeds
+        the question exactly as the user wrote it.
+        """
+        key = self._normalize_question(question)
+        qvec = self._canned_qvecs.get(key)
+        if qvec is None:
+            qvec = self._qvec_cache.get(key)
+        if qvec is None:
+            qvec = self._embed([question], "RETRIEVAL_QUERY")
+            faiss.normalize_L2(qvec)
+            self._qvec_cache[key] = qvec
+            while len(self._qvec_cache) > QVEC_CACHE_SIZE:
+                # Tolerate another worker thread evicting the same oldest key first
+                self._qvec_cache.pop(next(iter(self._qvec_cache)), None)
+        return qvec
 
-        prompt = f"""
+    def search_many(self, qvecs: np.ndarray, k: int):
+        """Search a stack of pre-normalised query vectors in one FAISS call.
+
+        FAISS parallelises a multi-row search across queries with OpenMP, so
+        batching several questions is cheaper than calling search per row.
+        """
+        k = min(k, self.index.ntotal, GPU_MAX_K)
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = max(HNSW_EF_SEARCH, k * 8)
+        return self.index.search(np.ascontiguousarray(qvecs, dtype=np.float32), k)
+
+    def _retrieve(self, qvec: np.ndarray, top_k: int) -> str:
+        """Return the top_k nearest chunks joined as prompt context."""
+        D, I = self.search_many(qvec, top_k)
+        return "\n".join([self.chunks[idx] for idx in I[0]])
+
+    def _build_prompt(self, context: str, question: str) -> str:
+        return f"""
         You are an assistant that answers questions about a real estate project.
         Rely **only** on the information provided in the brochure context below.
         If the answer is not explicitly stated in the context, reply: "The brochure does not provide this information."
@@ -100,13 +415,85 @@ class MarkdownVectorDB:
         Answer:
         """
 
+    def _generate(self, prompt: str) -> str:
         resp = self.client.models.generate_content(
             model="gemini-2.5-flash",
             contents=prompt
         )
-
         return resp.text
 
+    @staticmethod
+    def _normalize_question(question: str) -> str:
+        """Case-, punctuation- and whitespace-insensitive cache key for a question."""
+        # Punctuation becomes a space rather than vanishing, so "3.5" and "35" stay distinct
+        return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", question.lower())).strip()
+
+    def _answer_key(self, question: str, top_k: int) -> str:
+        return f"{top_k}|{self._normalize_question(question)}"
+
+    def _cached_answer(self, key: str):
+        hit = self._answer_cache.get(key)
+        if hit is None:
+            return None
+        stored_at, answer = hit
+        if time.monotonic() - stored_at > self.answer_ttl:
+            self._answer_cache.pop(key, None)
+            return None
+        return answer
+
+    def _store_answer(self, key: str, answer: str) -> None:
+        # An empty or blocked response is not worth remembering
+        if not answer:
+            return
+        now = time.monotonic()
+        # Snapshot before sweeping, since other threads may write concurrently
+        for k, (stored_at, _) in list(self._answer_cache.items()):
+            if now - stored_at > self.answer_ttl:
+                self._answer_cache.pop(k, None)
+        self._answer_cache[key] = (now, answer)
+        while len(self._answer_cache) > ANSWER_CACHE_SIZE:
+            self._answer_cache.pop(next(iter(self._answer_cache)), None)
+
+    def query(self, question: str, top_k: int = 3) -> str:
+        """Query the vectordb and return Gemini’s response."""
+        key = self._answer_key(question, top_k)
+        answer = self._cached_answer(key)
+        if answer is None:
+            context = self._retrieve(self._embed_query(question), top_k)
+            answer = self._generate(self._build_prompt(context, question))
+            self._store_answer(key, answer)
+        return answer
+
+    async def aquery(self, question: str, top_k: int = 3) -> str:
+        """Async variant of query() that runs the blocking Gemini calls in worker threads."""
+        key = self._answer_key(question, top_k)
+        answer = self._cached_answer(key)
+        if answer is None:
+            qvec = await asyncio.to_thread(self._embed_query, question)
+            context = self._retrieve(qvec, top_k)
+            answer = await asyncio.to_thread(self._generate, self._build_prompt(context, question))
+            self._store_answer(key, answer)
+        return answer
+
+    async def aquery_stream(self, question: str, top_k: int = 3):
+        """Like aquery(), but yields the answer in pieces as Gemini streams them."""
+        key = self._answer_key(question, top_k)
+        answer = self._cached_answer(key)
+        if answer is not None:
+            yield answer
+            return
+
+        qvec = await asyncio.to_thread(self._embed_query, question)
+        context = self._retrieve(qvec, top_k)
+        parts = []
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model="gemini-2.5-flash",
+            contents=self._build_prompt(context, question)
+        ):
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        self._store_answer(key, "".join(parts))
 
 
 if __name__ == "__main__":
@@ -10,7 +10,7 @@ load_dotenv()
 from typing import List, Dict, Any
 from elements_breakdown import BrochureProcessor
 from main import process_brochure_pdf
-from genai import MarkdownVectorDB
+from genai import MarkdownVectorDB, CANNED_QUESTIONS
 
 # Globals
 genai_db = None
@@ -68,14 +68,24 @@ def format_extracted_data(data: Dict[str, Any]) -> str:
 
     return "\n".join(lines)
 
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
 def load_images_from_directory(images_dir: str) -> List[str]:
     """Load image file paths from a directory for gallery display."""
     image_paths = []
-    if os.path.exists(images_dir):
-        for root, _, files in os.walk(images_dir):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_paths.append(os.path.join(root, file))
+    pending = [images_dir] if os.path.isdir(images_dir) else []
+    while pending:
+        # scandir exposes the entry type from the dirent, avoiding a stat per file
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue  # Skip unreadable directories, as os.walk did
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    image_paths.append(entry.path)
     return sorted(image_paths)
 
 def process_brochure_handler(pdf_file):
@@ -227,8 +237,8 @@ def process_brochure_handler(pdf_file):
         traceback.print_exc()
         return f"❌ Critical error: {str(e)}", [], None
 
-def ask_question_handler(history: List, question: str, extraction_data: Dict[str, Any]) -> List:
-    """Handle user questions with comprehensive error handling and debugging"""
+async def ask_question_handler(history: List, question: str, extraction_data: Dict[str, Any]):
+    """Handle user questions, streaming the answer into the chat as it is generated"""
     global genai_db
     
     print(f"\n{'='*30}")
@@ -247,45 +257,51 @@ def ask_question_handler(history: List, question: str, extraction_data: Dict[str
     # Check empty question
     if not question or not question.strip():
         print("⚠️ Empty question")
-        return history + [("user", ""), ("assistant", "Please type a question.")]
+        yield history + [("user", ""), ("assistant", "Please type a question.")]
+        return
     
     question = question.strip()
     
     # Check if brochure data exists
     if extraction_data is None:
         print("❌ No extraction data")
-        return history + [("user", question), ("assistant", "❌ Please upload and process a brochure first.")]
+        yield history + [("user", question), ("assistant", "❌ Please upload and process a brochure first.")]
+        return
     
     # Check if GenAI DB is available
     if genai_db is None:
         print("❌ GenAI DB not available")
-        return history + [("user", question), ("assistant", "❌ Q&A system is not available. Please try re-uploading the brochure or check your API key.")]
+        yield history + [("user", question), ("assistant", "❌ Q&A system is not available. Please try re-uploading the brochure or check your API key.")]
+        return
     
     try:
         print(f"🤖 Querying GenAI DB...")
-        answer = genai_db.query(question)
+        answer = ""
+        async for piece in genai_db.aquery_stream(question):
+            answer += piece
+            yield history + [("user", question), ("assistant", answer)]
         
         # Ensure answer is a string
-        answer_str = str(answer) if answer else "I couldn't find an answer to your question."
+        answer_str = answer if answer else "I couldn't find an answer to your question."
         
         print(f"✅ Got answer ({len(answer_str)} chars): {answer_str[:100]}{'...' if len(answer_str) > 100 else ''}")
         
         new_history = history + [("user", question), ("assistant", answer_str)]
         print(f"✅ Updated history length: {len(new_history)}")
         
-        return new_history
+        yield new_history
         
     except AttributeError as e:
         print(f"❌ AttributeError: {e}")
         error_msg = "❌ There's an issue with the Q&A system. Please try re-uploading the brochure."
-        return history + [("user", question), ("assistant", error_msg)]
+        yield history + [("user", question), ("assistant", error_msg)]
     
     except Exception as e:
         print(f"❌ Q&A Error: {e}")
         print(f"Error type: {type(e).__name__}")
         traceback.print_exc()
         error_msg = f"❌ Sorry, I encountered an error: {str(e)}"
-        return history + [("user", question), ("assistant", error_msg)]
+        yield history + [("user", question), ("assistant", error_msg)]
 
 def clear_all():
     """Clear all data and reset the interface"""
@@ -492,8 +508,12 @@ with gr.Blocks(css=css, title="Brochure Analyzer") as demo:
     q_btn.click(
         fn=ask_question_handler,
         inputs=[chat_state, question_input, data_state],
-        outputs=[chat_state],
+        outputs=[chatbot],  # Stream partial answers straight to the chat display
         show_progress=True
+    ).then(
+        lambda x: x,
+        inputs=[chatbot],
+        outputs=[chat_state]
     ).then(
         lambda: "",  # Clear input after sending
         outputs=[question_input]
@@ -502,8 +522,12 @@ with gr.Blocks(css=css, title="Brochure Analyzer") as demo:
     question_input.submit(
         fn=ask_question_handler,
         inputs=[chat_state, question_input, data_state],
-        outputs=[chat_state],
+        outputs=[chatbot],  # Stream partial answers straight to the chat display
         show_progress=True
+    ).then(
+        lambda x: x,
+        inputs=[chatbot],
+        outputs=[chat_state]
     ).then(
         lambda: "",  # Clear input after sending
         outputs=[question_input]
@@ -516,10 +540,10 @@ with gr.Blocks(css=css, title="Brochure Analyzer") as demo:
     )
 
     # Sample question handlers
-    sample_q1.click(lambda: "What are the different BHK configurations available?", outputs=[question_input])
-    sample_q2.click(lambda: "List all the amenities available in this project.", outputs=[question_input])
-    sample_q3.click(lambda: "Where is this project located? What are nearby landmarks?", outputs=[question_input])
-    sample_q4.click(lambda: "Who is the builder and what are the project details?", outputs=[question_input])
+    sample_q1.click(lambda: CANNED_QUESTIONS[0], outputs=[question_input])
+    sample_q2.click(lambda: CANNED_QUESTIONS[1], outputs=[question_input])
+    sample_q3.click(lambda: CANNED_QUESTIONS[2], outputs=[question_input])
+    sample_q4.click(lambda: CANNED_QUESTIONS[3], outputs=[question_input])
 
     # Update chat display
     chat_state.change(